@@ -1,32 +1,99 @@
 import bpy
 import struct
+import numpy as np
 from bpy_extras.io_utils import ExportHelper
-from mathutils import Vector
 
-def get_bone_pose(bone):
-    return (Vector((0, bone.parent.length, 0)) + bone.head if bone.parent else bone.head,
-        bone.matrix.to_quaternion())
-        
-def write_transform(f, position, rotation):
-    f.write(struct.pack("<3f", -position.x, position.z, position.y))
-    f.write(struct.pack("<4f", -rotation.x, rotation.z, rotation.y, rotation.w))
-    
+# file header: magic, bone count and frame count
+HEADER_STRUCT = struct.Struct("<8sBI")
+
+# convert an (n, 4, 4) array of transform matrices to an (n, 4) array of (w, x, y, z) quaternions
+# uses Shepperd's method, picking the most numerically stable formula per matrix
+def matrices_to_quaternions(matrices):
+    # normalize the rotation part first, the same as Matrix.to_quaternion does
+    m = matrices[:, :3, :3] / np.linalg.norm(matrices[:, :3, :3], axis=1, keepdims=True)
+    (m00, m01, m02) = (m[:, 0, 0], m[:, 0, 1], m[:, 0, 2])
+    (m10, m11, m12) = (m[:, 1, 0], m[:, 1, 1], m[:, 1, 2])
+    (m20, m21, m22) = (m[:, 2, 0], m[:, 2, 1], m[:, 2, 2])
+
+    # candidates for 4 * w^2, 4 * x^2, 4 * y^2 and 4 * z^2
+    diagonals = np.stack((1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22), axis=1)
+    largest = np.argmax(diagonals, axis=1)
+    s = 2 * np.sqrt(np.maximum(diagonals[np.arange(len(m)), largest], 1e-12))
+
+    candidates = np.stack((
+        np.stack((s / 4, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s), axis=1),
+        np.stack(((m21 - m12) / s, s / 4, (m01 + m10) / s, (m02 + m20) / s), axis=1),
+        np.stack(((m02 - m20) / s, (m01 + m10) / s, s / 4, (m12 + m21) / s), axis=1),
+        np.stack(((m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, s / 4), axis=1)), axis=1)
+    quaternions = candidates[np.arange(len(m)), largest]
+    quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    # q and -q are the same rotation, keep w positive so the output is consistent between frames
+    quaternions[quaternions[:, 0] < 0] *= -1
+    return quaternions
+
+# fetch a 4x4 matrix property of every item in a bpy collection as an (n, 4, 4) array
+def get_matrices(collection, attribute):
+    matrices = np.empty((len(collection), 4, 4), dtype=np.float32)
+    collection.foreach_get(attribute, matrices.ravel())
+    # blender gives matrices in column major order
+    return matrices.transpose(0, 2, 1)
+
+# compute each matrix relative to its parent's, items without a parent (index -1) are left as is
+def get_offset_matrices(matrices, parent_inds):
+    parent_matrices = np.where((parent_inds >= 0)[:, None, None], matrices[parent_inds], np.identity(4, dtype=np.float32))
+    return np.linalg.inv(parent_matrices) @ matrices
+
+# whether every bone's pose follows directly from its parent, its rest pose and its own loc/rot/scale
+# if so the offset of a bone from its parent is just its rest offset times its matrix_basis,
+# and the pose doesn't need to be evaluated by the depsgraph every frame
+def is_simple_pose(armature):
+    if armature.animation_data.drivers:
+        return False
+    for pose_bone in armature.pose.bones:
+        bone = pose_bone.bone
+        inherits_scale = bone.inherit_scale == 'FULL' if hasattr(bone, "inherit_scale") else bone.use_inherit_scale
+        if pose_bone.constraints or not (bone.use_inherit_rotation and bone.use_local_location and inherits_scale):
+            return False
+    return True
+
 def export_animation(armature, context, filename):
     action = armature.animation_data.action
     armature.pose.backup_create(action)
-    base_poses = [get_bone_pose(bone) for bone in armature.data.bones]
     
-    with open(filename, "wb") as f:
-        first_frame, last_frame = map(int, action.frame_range)
-        f.write(struct.pack("<8sBI", "animfile".encode("utf-8"), len(armature.data.bones), last_frame - first_frame + 1))
-        for frame in range(first_frame, last_frame + 1):
-            armature.pose.apply_pose_from_action(action, evaluation_time = frame)
+    first_frame, last_frame = map(int, action.frame_range)
+    pose_bones = armature.pose.bones
+    num_bones = len(pose_bones)
+    num_frames = last_frame - first_frame + 1
+    
+    # parent index of each bone, -1 for bones without a parent
+    bone_inds = {bone.name: i for (i, bone) in enumerate(pose_bones)}
+    parents = [bone.parent for bone in pose_bones]
+    parent_inds = np.array([bone_inds[parent.name] if parent else -1 for parent in parents], dtype=np.int32)
+    
+    simple_pose = is_simple_pose(armature)
+    if simple_pose:
+        rest_offset_matrices = get_offset_matrices(get_matrices(armature.data.bones, "matrix_local"), parent_inds)
+    
+    # position followed by rotation of each bone relative to its parent, for every frame
+    transforms = np.empty((num_frames, num_bones, 7), dtype="<f4")
+    for (i, frame) in enumerate(range(first_frame, last_frame + 1)):
+        armature.pose.apply_pose_from_action(action, evaluation_time = frame)
+        if simple_pose:
+            offset_matrices = rest_offset_matrices @ get_matrices(pose_bones, "matrix_basis")
+        else:
             context.view_layer.update()
-            for ((base_position, base_rotation), bone) in zip(base_poses, armature.pose.bones):
-                offset_matrix = bone.parent.matrix.inverted() @ bone.matrix if bone.parent else bone.matrix
-                write_transform(f, offset_matrix.translation, offset_matrix.to_quaternion())
+            offset_matrices = get_offset_matrices(get_matrices(pose_bones, "matrix"), parent_inds)
+        
+        positions = offset_matrices[:, :3, 3]
+        rotations = matrices_to_quaternions(offset_matrices)
+        transforms[i] = np.column_stack((-positions[:, 0], positions[:, 2], positions[:, 1],
+            -rotations[:, 1], rotations[:, 3], rotations[:, 2], rotations[:, 0]))
     
     armature.pose.backup_restore()
+    
+    with open(filename, "wb") as f:
+        f.write(HEADER_STRUCT.pack("animfile".encode("utf-8"), num_bones, num_frames))
+        f.write(transforms.tobytes())
     return {'FINISHED'}
 
 class AnimationExport(bpy.types.Operator, ExportHelper):
@@ -1,206 +1,392 @@
 import bpy
 import struct
+import itertools
+import numpy as np
 from bpy_extras.io_utils import ExportHelper
-from mathutils import Vector
+
+# blosc isn't bundled with blender, compressed export is only available if it has been installed separately
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+# numba isn't bundled with blender either, if it has been installed it's used to compile the permutation dedup
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# file header: magic, attribute count, vertex size, vertex count and index count
+HEADER_STRUCT = struct.Struct("<8sB3I")
+# follows the header only when short indices are enabled: index size in bytes, 2 or 4
+INDEX_SIZE_STRUCT = struct.Struct("<B")
+# follows each attribute name: attribute size and offset within a vertex
+ATTRIB_INFO_STRUCT = struct.Struct("<2I")
 
 def c_str(s):
-    return struct.pack("<" + str(len(s) + 1) + "s", s.encode("utf-8"))
-
-# find all the uv coords used by each vertex, and which loops use which uvs
-# return a tuple of lists
-# the first list contains a list per mesh vertex, whose items are a tuple containing
-# a uv coordinate and a list of loop indices for that uv
-# the second list contains an index per loop, of which uv it uses for its corresponding vertex
-def map_vertex_uvs(mesh, uv_layer):
-    vertex_uv_lists = [[] for _ in mesh.vertices]
-    loop_uv_inds = [0] * len(mesh.loops)
-    for loop, uv_loop in zip(mesh.loops, uv_layer.data):
-        uv_list = vertex_uv_lists[loop.vertex_index]
-        c_uv = uv_loop.uv
-        found = False
-        for i in range(len(uv_list)):
-            (uv, loop_inds) = uv_list[i]
-            if (c_uv - uv).length < 0.001:
-                found = True
-                loop_uv_inds[loop.index] = i
-                loop_inds.append(loop.index)
-                break
-        if not found:
-            loop_uv_inds[loop.index] = len(uv_list)
-            uv_list.append((c_uv, [loop.index]))
-    return (vertex_uv_lists, loop_uv_inds)
+    return s.encode("utf-8") + b"\x00"
+
+# loops whose attribute values are closer than this are treated as using the same value
+ATTRIB_EPSILON = 0.001
 
-# find all normals for each vertex, and which loops use which normals
-# returns similar info to above, except for normals rather than uvs
+# get the vertex index of every loop in the mesh as an array
+def get_loop_vertex_inds(mesh):
+    loop_vertex_inds = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertex_inds)
+    return loop_vertex_inds
+
+# get the uv coord of every loop in the mesh as an (n, 2) array
+# loops get a uv of (0, 0) if the mesh has no uv layer
+def get_loop_uvs(mesh, uv_layer):
+    loop_uvs = np.zeros((len(mesh.loops), 2), dtype=np.float32)
+    if uv_layer:
+        uv_layer.data.foreach_get("uv", loop_uvs.ravel())
+    return loop_uvs
+
+# get the normal of every loop in the mesh as an (n, 3) array
 # this method handles smooth and flat shading per polygon
 # if only smooth shading is used, every normal will just be the vertex normal
-def map_vertex_normals(mesh):
-    # list containing lists of tuples of vertex normals and list of indices for that normal
-    # for each vertex 
-    vertex_normals_list = [[] for _ in mesh.vertices]
-    loop_normal_inds = [0] * len(mesh.loops)
-    for poly in mesh.polygons:
-        # use polygon normal if flat shaded otherwise use vertex normal
-        normals = ([poly.normal] * len(poly.loop_indices) if not poly.use_smooth else
-            [mesh.vertices[v].normal for v in [mesh.loops[i].vertex_index for i in poly.loop_indices]])
-
-        # iterate both the normals and loops that make up this polygon
-        for (c_n, loop) in zip(normals, [mesh.loops[i] for i in poly.loop_indices]):
-            normals_list = vertex_normals_list[loop.vertex_index]
-            # try to find if this normal is in the list of normals for this vertex already
-            found = False
-            for i in range(len(normals_list)):
-                (n, loop_inds) = normals_list[i]
-                if (c_n - n).length < 0.001:
-                    # if found, add this loop index to the list
-                    found = True
-                    loop_normal_inds[loop.index] = i
-                    loop_inds.append(loop.index)
-                    break
-            # if not found, add an item to the list for this normal and loop
-            if not found:
-                loop_normal_inds[loop.index] = len(normals_list)
-                normals_list.append((c_n, [loop.index]))
-    
-    return (vertex_normals_list, loop_normal_inds)
+def get_loop_normals(mesh, loop_vertex_inds):
+    num_polygons = len(mesh.polygons)
+    polygon_normals = np.empty((num_polygons, 3), dtype=np.float32)
+    polygon_smooth = np.empty(num_polygons, dtype=bool)
+    loop_starts = np.empty(num_polygons, dtype=np.int32)
+    loop_totals = np.empty(num_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("normal", polygon_normals.ravel())
+    mesh.polygons.foreach_get("use_smooth", polygon_smooth)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    vertex_normals = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+    mesh.vertices.foreach_get("normal", vertex_normals.ravel())
+
+    # find the polygon each loop belongs to
+    loop_polygons = np.empty(len(mesh.loops), dtype=np.int32)
+    loop_offsets = np.repeat(loop_starts - (np.cumsum(loop_totals) - loop_totals), loop_totals)
+    loop_polygons[loop_offsets + np.arange(len(loop_offsets))] = np.repeat(np.arange(num_polygons), loop_totals)
+
+    # use polygon normal if flat shaded otherwise use vertex normal
+    return np.where(polygon_smooth[loop_polygons, None],
+        vertex_normals[loop_vertex_inds], polygon_normals[loop_polygons])
+
+# combine several int64 key columns into one dense id per row, ordered the same as sorting the rows
+# every step only sorts a flat int64 array, which is a lot faster than np.unique over rows
+def combine_keys(*columns):
+    ids = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        (unique_column, column_ids) = np.unique(column, return_inverse=True)
+        (_, ids) = np.unique(ids * len(unique_column) + column_ids.ravel(), return_inverse=True)
+        ids = ids.ravel()
+    return ids
+
+# group loops by their vertex and their cell of a grid, given as one array of integer cell coordinates per component
+# returns the group id of every loop, the loops sorted by group and the position of each group's first loop in that order
+def group_cells(loop_vertex_inds, cell_columns):
+    # the vertex and cell are packed into a single int64 key when they fit so grouping is just one sort,
+    # normals and uvs spanning a few units only need around 10 bits per component
+    cell_columns = [column - column.min() for column in cell_columns]
+    column_bits = [int(column.max()).bit_length() for column in cell_columns]
+    if int(loop_vertex_inds.max()).bit_length() + sum(column_bits) < 64:
+        keys = loop_vertex_inds.astype(np.int64)
+        for (column, bits) in zip(cell_columns, column_bits):
+            keys = (keys << bits) | column
+    else:
+        keys = combine_keys(loop_vertex_inds, *cell_columns)
+
+    order = np.argsort(keys)
+    is_start = np.diff(keys[order], prepend=-1) != 0
+    cell_ids = np.empty(len(keys), dtype=np.int64)
+    cell_ids[order] = np.cumsum(is_start) - 1
+    return (cell_ids, order, np.flatnonzero(is_start))
+
+# assign each loop a key such that loops of the same vertex whose values are within ATTRIB_EPSILON of each
+# other share a key, even when a quantization boundary falls between them
+# values are bucketed on grids with cells twice the epsilon wide, one grid per combination of offsetting
+# each component by half a cell, any two close enough values share a cell in at least one of the grids
+# loops sharing a cell in any grid are merged (transitively), keyed by the lowest loop index among them
+def merge_close_values(loop_vertex_inds, values):
+    keys = np.arange(len(values), dtype=np.int64)
+    if not len(values):
+        return keys
+
+    # merge on the unshifted grid first, vertices whose loops all land in one cell are done after that since
+    # the other grids only ever merge loops of the same vertex, usually that's most of them
+    # components are kept as separate contiguous arrays, which is a lot faster to work through than columns
+    scaled_columns = [np.ascontiguousarray(column) / (2 * ATTRIB_EPSILON) for column in values.T]
+    (cell_ids, order, cell_starts) = group_cells(loop_vertex_inds,
+        [np.floor(column).astype(np.int64) for column in scaled_columns])
+    keys = np.minimum.reduceat(keys[order], cell_starts)[cell_ids]
+    vertex_cell_counts = np.bincount(loop_vertex_inds[order[cell_starts]])
+    split_loops = np.flatnonzero(vertex_cell_counts[loop_vertex_inds] > 1)
+    if not len(split_loops):
+        return keys
+
+    # the loops left are kept in order, so the lowest index among them is also the lowest loop index
+    split_vertex_inds = loop_vertex_inds[split_loops]
+    split_columns = [column[split_loops] for column in scaled_columns]
+    grids = [group_cells(split_vertex_inds, [np.floor(column + offset).astype(np.int64)
+            for (column, offset) in zip(split_columns, offsets)])
+        for offsets in itertools.product((0.0, 0.5), repeat=len(split_columns))]
 
-# compute and enumerate the combinations of uv and normal for each vertex in the mesh
-# also compute the index into the final vertex loop for each loop in the mesh
+    # spread the lowest key through every cell until nothing changes
+    split_keys = np.arange(len(split_loops), dtype=np.int64)
+    while True:
+        new_keys = split_keys
+        for (cell_ids, order, cell_starts) in grids:
+            new_keys = np.minimum.reduceat(new_keys[order], cell_starts)[cell_ids]
+        # keys are indices into the loops left, so following them shortens long chains of merged cells
+        new_keys = new_keys[new_keys]
+        if np.array_equal(new_keys, split_keys):
+            break
+        split_keys = new_keys
+    keys[split_loops] = split_loops[split_keys]
+    return keys
+
+# find the unique (vertex, uv, normal) key combinations with a hash table, in a single pass over the loops
+# returns the first loop using each combination, in order of first use, and the combination index of every loop
+# this is compiled with numba when it's available, it's far too slow to run as plain python
+def dedup_loop_keys(vertex_keys, uv_keys, normal_keys):
+    num_loops = len(vertex_keys)
+    capacity = 1
+    while capacity < 2 * num_loops:
+        capacity *= 2
+    mask = capacity - 1
+
+    # open addressing table of combination indices, -1 marks an empty slot
+    table = np.full(capacity, -1, dtype=np.int64)
+    perm_loops = np.empty(num_loops, dtype=np.int64)
+    loop_inds = np.empty(num_loops, dtype=np.int64)
+    num_perms = 0
+    for loop in range(num_loops):
+        # FNV-1a, over whole 64 bit keys rather than bytes
+        h = np.uint64(14695981039346656037)
+        for key in (vertex_keys[loop], uv_keys[loop], normal_keys[loop]):
+            h = (h ^ np.uint64(key)) * np.uint64(1099511628211)
+        slot = np.int64(h & np.uint64(mask))
+        while True:
+            perm = table[slot]
+            if perm < 0:
+                table[slot] = num_perms
+                perm_loops[num_perms] = loop
+                loop_inds[loop] = num_perms
+                num_perms += 1
+                break
+            first = perm_loops[perm]
+            if (vertex_keys[first] == vertex_keys[loop] and uv_keys[first] == uv_keys[loop]
+                    and normal_keys[first] == normal_keys[loop]):
+                loop_inds[loop] = perm
+                break
+            slot = (slot + 1) & mask
+    return (perm_loops[:num_perms], loop_inds)
+
+if numba:
+    dedup_loop_keys = numba.njit(cache=True)(dedup_loop_keys)
+
+# compute and enumerate the combinations of uv and normal used by each vertex in the mesh
+# also compute the index into the final vertex list for each loop in the mesh
 #
-# returns a tuple containing two lists and the total output vertex (permutation) count
+# returns a tuple containing two arrays and the total output vertex (permutation) count
 #
-# the first list contains for each vertex a list of tuples, which in turn contain
-# the index into the final vertex list for this permutation, and the indices of the uv and
-# normal used by this permutation each as numbers in the range of 0 until the count of either
-# uvs or normals for this vertex, so they can index into the per-vertex lists returned by
-# the map_* functions above
+# the first array contains for each output vertex the index of a loop using it, which can be
+# used to look up the vertex index, uv and normal of that permutation
 #
-# the second list contains the index for each loop of the loop's vertex permutation, i.e.
+# the second array contains the index for each loop of the loop's vertex permutation, i.e.
 # the vertex index we need to write for this loop
-def find_vertex_permutations(mesh, loop_uv_inds, loop_normal_inds):
-    # figure out which combinations of vertex uvs and normals we need to export
-    # also figure out what the indices will be since the info we need is all here
-    vertex_permutations = [[] for _ in mesh.vertices]
-    loop_inds = [0] * len(mesh.loops)
-    c_index = 0
-    for (loop, c_uv_ind, c_normal_ind) in zip(mesh.loops, loop_uv_inds, loop_normal_inds):
-        found = False
-        perms = vertex_permutations[loop.vertex_index]
-        for i in range(len(perms)):
-            (ind, uv_ind, normal_ind) = perms[i]
-            if c_uv_ind == uv_ind and c_normal_ind == normal_ind:
-                found = True
-                loop_inds[loop.index] = ind
-        if not found:
-            perms.append((c_index, c_uv_ind, c_normal_ind))
-            loop_inds[loop.index] = c_index
-            c_index += 1
-
-    return (vertex_permutations, loop_inds, c_index)
-
-
-def export_mesh(object, filename, export_skinning_data):
-    mesh = object.data
-    with open(filename, "wb") as f:
-        # TODO: allow an option to enable/disable uv exporting as well as choosing a particular uv layer for export
-        uv_layer = mesh.uv_layers[0] if mesh.uv_layers else None
-        
-        if not mesh.loop_triangles:
-            mesh.calc_loop_triangles()
-
-        # find all permutations of uvs and normals that are used in the mesh per vertex and only write those
-        (vertex_uvs, loop_uv_inds) = map_vertex_uvs(mesh, uv_layer)
-        (vertex_normals, loop_normal_inds) = map_vertex_normals(mesh)
-        (vertex_perms, loop_inds, num_vertices) = find_vertex_permutations(mesh, loop_uv_inds, loop_normal_inds)
-
-        # get the loop indices in the proper number and order for triangulation
-        tri_inds = [loop_inds[i] for tri in mesh.loop_triangles for i in tri.loops]
-
-        # compute the actual vertex permutations using the indices we computed
-        positions = [None] * num_vertices
-        normals = [None] * num_vertices
-        uvs = [None] * num_vertices
-        joint_weights = [None] * num_vertices if export_skinning_data else []
-        joint_indices = [None] * num_vertices if export_skinning_data else []
-        
-        armature = object.find_armature()
-        group_indices = [i for i in range(len(armature.data.bones)) for group in object.vertex_groups
-            if group.name == armature.data.bones[i].name] if armature else [group.index for group in object.vertex_groups]
-        
-        for (vert, perms) in zip(mesh.vertices, vertex_perms):
-            if export_skinning_data:
-                joint_inds = [0, 0, 0, 0]
-                weights = [0, 0, 0, 0]
-                num_joints = 0
-                for group in vert.groups:
-                    if num_joints < 4:
-                        joint_inds[num_joints] = group_indices[group.group]
-                        weights[num_joints] = group.weight
-                        num_joints += 1
-                    else:
-                        for i in range(num_joints):
-                            if weights[i] < group.weight:
-                                joint_inds[i] = group_indices[group.group]
-                                weights[i] = group.weight
-                                break
-                weight_sum = 0
-                for weight in weights:
-                    weight_sum += weight
-                if weight_sum > 0:
-                    for weight in weights:
-                        weight = weight / weight_sum
-                for (ind, _, _) in perms:
-                    joint_weights[ind] = weights
-                    joint_indices[ind] = joint_inds
-                    
-            for (ind, uv_ind, normal_ind) in perms:
-                (normal, _) = vertex_normals[vert.index][normal_ind]
-                (uv, _) = vertex_uvs[vert.index][uv_ind]
-                positions[ind] = Vector((-vert.co.x, vert.co.z, vert.co.y))
-                normals[ind] = normal
-                uvs[ind] = uv
-        
-        attrib_infos = [
-            ("position", "<3f", positions),
-            ("normal", "<3f", normals),
-            ("texCoord", "<2f", uvs)
+def find_vertex_permutations(loop_vertex_inds, loop_uvs, loop_normals):
+    # uvs and normals are merged with their neighbours across cell boundaries, so seams and
+    # smooth shading don't get split by rounding
+    uv_keys = merge_close_values(loop_vertex_inds, loop_uvs)
+    normal_keys = merge_close_values(loop_vertex_inds, loop_normals)
+    if numba:
+        (perm_loops, loop_inds) = dedup_loop_keys(loop_vertex_inds.astype(np.int64), uv_keys, normal_keys)
+        return (perm_loops, loop_inds, len(perm_loops))
+
+    # otherwise a single sort over (vertex, uv, normal) keys finds every permutation at once,
+    # output vertices end up ordered by their source vertex
+    loop_keys = combine_keys(loop_vertex_inds, uv_keys, normal_keys)
+    (_, perm_loops, loop_inds) = np.unique(loop_keys, return_index=True, return_inverse=True)
+    return (perm_loops, loop_inds.ravel(), len(perm_loops))
+
+# find the (up to) 4 most influential joints of each vertex and their normalized weights
+# returns a tuple of a (n, 4) uint8 array of joint indices and a (n, 4) float32 array of weights
+# group_indices maps vertex group indices to joint indices, groups mapped to -1 don't influence the vertex
+def get_vertex_joints(mesh, group_indices):
+    # vertex group weights can't be fetched in bulk, so gather (vertex, group, weight) triples in one pass
+    element_vertex_inds = []
+    element_group_inds = []
+    element_weights = []
+    # bind the appends once, this loop runs for every vertex group element in the mesh
+    (append_vertex_ind, append_group_ind, append_weight) = (
+        element_vertex_inds.append, element_group_inds.append, element_weights.append)
+    for (vertex_ind, vert) in enumerate(mesh.vertices):
+        for group in vert.groups:
+            append_vertex_ind(vertex_ind)
+            append_group_ind(group.group)
+            append_weight(group.weight)
+    element_vertex_inds = np.array(element_vertex_inds, dtype=np.int64)
+    group_joint_inds = np.asarray(group_indices, dtype=np.int32)
+    element_joint_inds = group_joint_inds[np.array(element_group_inds, dtype=np.int64)]
+    element_weights = np.array(element_weights, dtype=np.float32)
+
+    # drop elements of groups that aren't joints
+    is_joint = element_joint_inds >= 0
+    (element_vertex_inds, element_joint_inds, element_weights) = (
+        element_vertex_inds[is_joint], element_joint_inds[is_joint], element_weights[is_joint])
+
+    # number the elements of each vertex from 0, elements are already grouped by vertex since they were gathered in vertex order
+    num_vertices = len(mesh.vertices)
+    group_counts = np.bincount(element_vertex_inds, minlength=num_vertices)
+    element_columns = np.arange(len(element_vertex_inds)) - (np.cumsum(group_counts) - group_counts)[element_vertex_inds]
+
+    # vertices with more than 4 elements keep their 4 heaviest, so renumber their elements by descending weight
+    # only their elements get sorted, and nothing is sized by the largest group count, so memory stays per element
+    many_groups = np.flatnonzero(group_counts[element_vertex_inds] > 4)
+    if len(many_groups):
+        by_weight = many_groups[np.lexsort((-element_weights[many_groups], element_vertex_inds[many_groups]))]
+        element_columns[by_weight] = element_columns[many_groups]
+
+    # lay the kept elements out in a (vertices, 4) table padded with zero weights
+    kept = element_columns < 4
+    joint_indices = np.zeros((num_vertices, 4), dtype=np.int32)
+    joint_weights = np.zeros((num_vertices, 4), dtype=np.float32)
+    joint_indices[element_vertex_inds[kept], element_columns[kept]] = element_joint_inds[kept]
+    joint_weights[element_vertex_inds[kept], element_columns[kept]] = element_weights[kept]
+
+    # joint indices are written as bytes, make sure they fit rather than letting them wrap around
+    if joint_indices.size and joint_indices.max() > 255:
+        raise ValueError("Vertices are weighted to joint index %d, only 256 joints can be exported" % joint_indices.max())
+    joint_indices = joint_indices.astype(np.uint8)
+
+    weight_sums = joint_weights.sum(axis=1, keepdims=True)
+    np.divide(joint_weights, weight_sums, out=joint_weights, where=weight_sums > 0)
+    return (joint_indices, joint_weights)
+
+
+# compute the vertex attributes and triangle indices to export for a mesh of the given object
+# returns a tuple of the attribute infos, each a tuple of name, format and per-vertex data, and the index array
+def get_vertex_attribs(object, mesh, export_skinning_data, quantize_normals, short_indices):
+    # TODO: allow an option to enable/disable uv exporting as well as choosing a particular uv layer for export
+    uv_layer = mesh.uv_layers[0] if mesh.uv_layers else None
+
+    # find all permutations of uvs and normals that are used in the mesh per vertex and only write those
+    loop_vertex_inds = get_loop_vertex_inds(mesh)
+    loop_uvs = get_loop_uvs(mesh, uv_layer)
+    loop_normals = get_loop_normals(mesh, loop_vertex_inds)
+    (perm_loops, loop_inds, num_vertices) = find_vertex_permutations(loop_vertex_inds, loop_uvs, loop_normals)
+
+    # get the loop indices in the proper number and order for triangulation
+    # if enabled, indices are written as shorts whenever every vertex can be addressed with one,
+    # leaving out 0xFFFF since that's the primitive restart index
+    tri_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("loops", tri_loops)
+    index_format = "<u2" if short_indices and num_vertices < 1 << 16 else "<u4"
+    tri_inds = loop_inds.astype(index_format)[tri_loops]
+
+    # compute the actual vertex permutations using the indices we computed
+    perm_vertex_inds = loop_vertex_inds[perm_loops]
+    vertex_positions = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+    mesh.vertices.foreach_get("co", vertex_positions.ravel())
+    # swap to the output axes, (x, y, z) -> (-x, z, y)
+    positions = vertex_positions[perm_vertex_inds][:, [0, 2, 1]] * np.array((-1, 1, 1), dtype=np.float32)
+    normals = loop_normals[perm_loops]
+    uvs = loop_uvs[perm_loops]
+    
+    # map vertex groups to the index of the bone with the same name, groups without a bone get -1
+    armature = object.find_armature()
+    if armature:
+        bone_inds = {bone.name: i for (i, bone) in enumerate(armature.data.bones)}
+        group_indices = [bone_inds.get(group.name, -1) for group in object.vertex_groups]
+    else:
+        group_indices = [group.index for group in object.vertex_groups]
+    
+    if export_skinning_data:
+        (vertex_joint_indices, vertex_joint_weights) = get_vertex_joints(mesh, group_indices)
+        joint_indices = vertex_joint_indices[perm_vertex_inds]
+        joint_weights = vertex_joint_weights[perm_vertex_inds]
+    
+    if quantize_normals:
+        # signed normalized bytes, padded with a zero to 4 so every attribute stays 4 byte aligned
+        normals = np.column_stack((np.clip(np.round(normals * 127), -127, 127), np.zeros(len(normals))))
+        normal_format = "<4i1"
+    else:
+        normal_format = "<3f4"
+
+    attrib_infos = [
+        ("position", "<3f4", positions),
+        ("normal", normal_format, normals),
+        ("texCoord", "<2f4", uvs)
+    ]
+    
+    if export_skinning_data:
+        attrib_infos += [
+            ("jointWeights", "<4f4", joint_weights),
+            ("jointIndices", "<4u1", joint_indices)
         ]
+
+    return (attrib_infos, tri_inds)
+
+def export_mesh(object, filename, export_skinning_data, compress=False, depsgraph=None, quantize_normals=False,
+        short_indices=False):
+    # export from a temporary mesh, with modifiers applied if a depsgraph is given, and free it when done
+    # so calculating triangles doesn't leave caches on the object's own mesh
+    mesh_object = object.evaluated_get(depsgraph) if depsgraph else object
+    mesh = mesh_object.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        (attrib_infos, tri_inds) = get_vertex_attribs(object, mesh, export_skinning_data, quantize_normals, short_indices)
+    finally:
+        mesh_object.to_mesh_clear()
+    num_vertices = len(attrib_infos[0][2])
+
+    # the interleaved vertex layout, attribute sizes and offsets are read straight from it
+    vertex_dtype = np.dtype([(name, format) for (name, format, _) in attrib_infos])
+    
+    # build header and attribute info up front so the file is written in a few large writes
+    # compressed files get their own magic so readers of the plain format reject them
+    magic = "meshblsc" if compress else "meshfile"
+    attrib_names = [c_str(name) for (name, _, _) in attrib_infos]
+    # the index size is only written when short indices are enabled, so other files keep the original layout
+    index_size_size = INDEX_SIZE_STRUCT.size if short_indices else 0
+    header = bytearray(HEADER_STRUCT.size + index_size_size
+        + sum(len(name) + ATTRIB_INFO_STRUCT.size for name in attrib_names))
+    HEADER_STRUCT.pack_into(header, 0, magic.encode("utf-8"), len(attrib_infos), vertex_dtype.itemsize, num_vertices,  len(tri_inds))
+    offset = HEADER_STRUCT.size
+    if short_indices:
+        INDEX_SIZE_STRUCT.pack_into(header, offset, tri_inds.itemsize)
+        offset += INDEX_SIZE_STRUCT.size
+    for ((name, _, _), attrib_name) in zip(attrib_infos, attrib_names):
+        (attrib_dtype, attrib_offset) = vertex_dtype.fields[name]
+        header[offset:offset + len(attrib_name)] = attrib_name
+        offset += len(attrib_name)
+        ATTRIB_INFO_STRUCT.pack_into(header, offset, attrib_dtype.itemsize, attrib_offset)
+        offset += ATTRIB_INFO_STRUCT.size
         
-        if export_skinning_data:
-            attrib_infos += [
-                ("jointWeights", "<4f", joint_weights),
-                ("jointIndices", "<4B", joint_indices)
-            ]
-                
-        attrib_sizes = []
-        attrib_offsets = []
-        vertex_size = 0
-        for (name, format, _) in attrib_infos:
-            attrib_sizes.append(struct.calcsize(format))
-            attrib_offsets.append(vertex_size)
-            vertex_size += attrib_sizes[-1]
-        
-        # write header
-        f.write(struct.pack("<8sB3I", "meshfile".encode("utf-8"), len(attrib_infos), vertex_size, num_vertices,  len(tri_inds)))
-            
-        # write attribute info
-        for i in range(len(attrib_infos)):
-            (name, _, _) = attrib_infos[i]
-            f.write(c_str(name))
-            f.write(struct.pack("<2I", attrib_sizes[i], attrib_offsets[i]))
-            
-        # write vertex attributes interleaved
-        for i in range(num_vertices):
-            for (_, format, elements) in attrib_infos:
-                f.write(struct.pack(format, *(elements[i])))
-            
-        # write index buffer
-        f.write(struct.pack("<" + str(len(tri_inds)) + "I", *tri_inds))
+    # interleave vertex attributes, packed all at once into a structured array
+    vertices = np.empty(num_vertices, dtype=vertex_dtype)
+    for (name, _, elements) in attrib_infos:
+        vertices[name] = elements
+    
+    with open(filename, "wb") as f:
+        f.write(header)
+        if compress:
+            # vertices are almost all 4 byte values, so shuffling with a type size of 4 groups together
+            # the similar bytes of neighbouring floats, indices are shuffled by their own size
+            # each buffer is written as its compressed size followed by the compressed data
+            for (buffer, typesize) in ((vertices, 4), (tri_inds, tri_inds.itemsize)):
+                compressed = blosc.compress(buffer.tobytes(), typesize=typesize, cname="lz4", shuffle=blosc.SHUFFLE)
+                f.write(struct.pack("<Q", len(compressed)))
+                f.write(compressed)
+        else:
+            # write straight from the arrays' memory rather than copying them into bytes objects first
+            f.write(vertices)
+            f.write(tri_inds)
     
     return {'FINISHED'}
 
-def export_scene(context, filename, export_skinning_data):
-    return export_mesh(context.object, filename, export_skinning_data)
+def export_scene(context, filename, export_skinning_data, compress, apply_modifiers, quantize_normals, short_indices):
+    depsgraph = context.evaluated_depsgraph_get() if apply_modifiers else None
+    return export_mesh(context.object, filename, export_skinning_data, compress, depsgraph, quantize_normals,
+        short_indices)
 
 class CustomMeshExport(bpy.types.Operator, ExportHelper):
     """Export mesh to custom binary file"""
@@ -224,8 +410,42 @@ class CustomMeshExport(bpy.types.Operator, ExportHelper):
         default=False,
     )
 
+    apply_modifiers: bpy.props.BoolProperty(
+        name="Apply Modifiers",
+        description="Export the mesh with its modifiers applied. Leave off for skinned meshes, "
+            "since an armature modifier would bake in the current pose",
+        default=False,
+    )
+
+    quantize_normals: bpy.props.BoolProperty(
+        name="Quantize Normals",
+        description="Export normals as 4 signed normalized bytes (the last is padding) instead of 3 floats",
+        default=False,
+    )
+
+    short_indices: bpy.props.BoolProperty(
+        name="Short Indices",
+        description="Export 16 bit indices when the mesh has fewer than 65536 vertices. "
+            "Adds the index size in bytes after the file header",
+        default=False,
+    )
+
+    compress: bpy.props.BoolProperty(
+        name="Compress",
+        description="Compress the vertex and index buffers with Blosc (requires the blosc module)",
+        default=False,
+    )
+
     def execute(self, context):
-        return export_scene(context, self.filepath, self.export_skinning_data)
+        if self.compress and blosc is None:
+            self.report({'ERROR'}, "Compressed export requires the blosc module, which is not installed")
+            return {'CANCELLED'}
+        try:
+            return export_scene(context, self.filepath, self.export_skinning_data, self.compress, self.apply_modifiers,
+                self.quantize_normals, self.short_indices)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
 
 def register():
     bpy.utils.register_class(CustomMeshExport)
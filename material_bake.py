@@ -105,6 +105,31 @@ class NodeTreeChanges(NamedTuple):
     removed_links: list
     changed_defaults: dict
 
+# Get the BSDF nodes in a node tree, caching them in bsdf_node_cache keyed by the tree's pointer
+# Every baker searches the same trees for BSDFs, so the operator makes one cache per bake and shares it between bakers
+# It must not outlive the bake, since nodes may be added or removed between bakes
+def get_bsdf_nodes(bsdf_node_cache, node_tree):
+    key = node_tree.as_pointer()
+    bsdf_nodes = bsdf_node_cache.get(key, None)
+    if bsdf_nodes is None:
+        bsdf_nodes = bsdf_node_cache[key] = [node for node in node_tree.nodes if node.type.startswith('BSDF')]
+    return bsdf_nodes
+
+# Inputs the Principled BSDF always has, which can be indexed directly instead of searched for
+PRINCIPLED_INPUTS = {'Base Color', 'Metallic', 'Roughness'}
+
+# Get an input of a BSDF node by name, or None if it has no such input
+# Inputs are cached in bsdf_input_cache keyed by the node's pointer and the input name, since several bakers
+# look up the same inputs on the same nodes. Like the BSDF node cache, the operator makes one per bake
+def get_bsdf_input(bsdf_input_cache, bsdf_node, name):
+    key = (bsdf_node.as_pointer(), name)
+    if key not in bsdf_input_cache:
+        if bsdf_node.type == 'BSDF_PRINCIPLED' and name in PRINCIPLED_INPUTS:
+            bsdf_input_cache[key] = bsdf_node.inputs[name]
+        else:
+            bsdf_input_cache[key] = bsdf_node.inputs.get(name, None)
+    return bsdf_input_cache[key]
+
 # Base class defining the common interface for baking an attribute
 class VKMaterialImageBaker:
     
@@ -118,6 +143,8 @@ class VKMaterialImageBaker:
         self.bake_pass_filter = bake_pass_filter
         self.image_alpha = image_alpha
         self.image_data = image_data
+        self.bsdf_node_cache = None
+        self.bsdf_input_cache = None
     
     
     def __on_edit_node_tree(self, node_tree):
@@ -127,20 +154,26 @@ class VKMaterialImageBaker:
                 self.current_tree_changes = NodeTreeChanges(node_tree, [], [], [], {})
                 self.node_tree_changes[node_tree] = self.current_tree_changes
                 
-    def __restore_node_tree(self, node_tree):
-        self.__on_edit_node_tree(node_tree)
+    def __restore_node_tree(self, changes):
+        # Nothing to do for trees that were looked at but left unchanged
+        if not (changes.changed_defaults or changes.added_links or changes.removed_links or changes.added_nodes):
+            return
+        
+        links = changes.node_tree.links
         
-        for socket, value in self.current_tree_changes.changed_defaults.items():
+        for socket, value in changes.changed_defaults.items():
             socket.default_value = value
         
-        for link in self.current_tree_changes.added_links:
-            node_tree.links.remove(link)
+        for link in changes.added_links:
+            links.remove(link)
         
-        for link_info in self.current_tree_changes.removed_links:
-            node_tree.links.new(link_info['from'], link_info['to'])
+        for link_info in changes.removed_links:
+            links.new(link_info['from'], link_info['to'])
             
-        for node in self.current_tree_changes.added_nodes:
-            node_tree.nodes.remove(node)
+        # Nodes go last, removing one also removes its links, which would make removing them above fail
+        nodes = changes.node_tree.nodes
+        for node in changes.added_nodes:
+            nodes.remove(node)
     
     # Methods to be used by subclasses for preparing the material node tree for baking
     # Using these methods ensures changes are tracked and can be reverted automatically
@@ -165,10 +198,21 @@ class VKMaterialImageBaker:
         self.current_tree_changes.removed_links.append({'from':link.from_socket, 'to':link.to_socket})
         node_tree.links.remove(link)
         
+    # Relink the input of an existing link to a different output
+    # Linking an already linked input replaces its link, so this changes the tree once rather than removing then adding
+    def replace_link(self, node_tree, link, output):
+        self.__on_edit_node_tree(node_tree)
+        
+        self.current_tree_changes.removed_links.append({'from':link.from_socket, 'to':link.to_socket})
+        new_link = node_tree.links.new(output, link.to_socket)
+        self.current_tree_changes.added_links.append(new_link)
+        return new_link
+        
     def set_default(self, node_tree, socket, value):
         self.__on_edit_node_tree(node_tree)
         
-        self.current_tree_changes.changed_defaults[socket] = socket.default_value
+        # Keep the first value stored, so changing the same socket twice still restores the original
+        self.current_tree_changes.changed_defaults.setdefault(socket, socket.default_value)
         socket.default_value = value
         
     # This may be overridden by subclasses to implement custom node tree modification behavior
@@ -177,26 +221,33 @@ class VKMaterialImageBaker:
         pass
     
     # The public interface for baking
+    # node_trees is the list of unique node trees used by the selected objects' materials, which are prepared for the bake
     # It's assumed the image texture nodes have been created already and are passed in as object_image_texture_nodes,
     # in the format of a dictionary where keys are objects and values are lists of nodes
     # object_images is a dictionary where keys are objects and values are dictionaries, with keys being the bake type strings
     # and values being the images baked to. it should be pre-initialized with a dictionary per object by the caller.
-    def execute(self, context, object_image_texture_nodes, object_images):
+    # bsdf_node_cache and bsdf_input_cache are the dictionaries used by get_bsdf_nodes and get_bsdf_input,
+    # shared by all bakers of one bake
+    def execute(self, context, node_trees, bsdf_node_cache, bsdf_input_cache, object_image_texture_nodes, object_images):
+        self.bsdf_node_cache = bsdf_node_cache
+        self.bsdf_input_cache = bsdf_input_cache
         ret = None
-        if self.enabled:
+        # There's nothing to bake to without any objects with materials, so don't run the bake at all
+        if self.enabled and object_image_texture_nodes:
             images = []
             
             #try:
-            for object in context.selected_objects:
-                for slot in object.material_slots:
-                    self.prepare_node_tree(slot.material.node_tree)
+            # Skip walking the trees entirely for bakers that don't override prepare_node_tree
+            if type(self).prepare_node_tree is not VKMaterialImageBaker.prepare_node_tree:
+                for node_tree in node_trees:
+                    self.prepare_node_tree(node_tree)
             
+            (image_type, size, alpha, is_data) = (self.type, self.image_size, self.image_alpha, self.image_data)
             for object, image_texture_nodes in object_image_texture_nodes.items():
-                image = bpy.data.images.new(object.name + "_bake_target_" + self.type,
-                    self.image_size, self.image_size, alpha=self.image_alpha, is_data=self.image_data)
+                image = bpy.data.images.new(f"{object.name}_bake_target_{image_type}", size, size, alpha=alpha, is_data=is_data)
                 
                 images.append(image)
-                object_images[object][self.type] = image
+                object_images[object][image_type] = image
                 for node in image_texture_nodes:
                     node.image = image
                     
@@ -207,23 +258,22 @@ class VKMaterialImageBaker:
             #except:
             #    ret = ({'WARNING'}, "One or more materials is not compatible with bake type: " + self.type + ". Bake will be skipped.")
             
-            for node_tree in self.node_tree_changes.keys():
-                self.__restore_node_tree(node_tree)
+            for changes in self.node_tree_changes.values():
+                self.__restore_node_tree(changes)
                 
         return ret
 
 # Baker subclass for diffuse images
 class VKDiffuseImageBaker(VKMaterialImageBaker):
     
-    def __init__(self, props):
-        super().__init__(props.bake_diffuse, props.diffuse_texture_size, "diffuse", 'DIFFUSE', {'COLOR', 'DIFFUSE'}, True, False)
+    def __init__(self, enabled, image_size):
+        super().__init__(enabled, image_size, "diffuse", 'DIFFUSE', {'COLOR', 'DIFFUSE'}, True, False)
         
     def prepare_node_tree(self, node_tree):
         # Remove any metallic value, which for some reason interferes with diffuse bake
         # I'm not sure which BSDFs have metallic inputs, it may just be Principled, but I'm searching them all anyway
-        bsdf_nodes = filter(lambda node: "Bsdf" in node.bl_idname, node_tree.nodes)
-        for bsdf_node in bsdf_nodes:
-            metallic_input = bsdf_node.inputs.get('Metallic', None)
+        for bsdf_node in get_bsdf_nodes(self.bsdf_node_cache, node_tree):
+            metallic_input = get_bsdf_input(self.bsdf_input_cache, bsdf_node, 'Metallic')
             if metallic_input:
                 if metallic_input.is_linked:
                     self.remove_link(node_tree, metallic_input.links[0])
@@ -232,41 +282,40 @@ class VKDiffuseImageBaker(VKMaterialImageBaker):
 # Baker subclass for normal maps
 class VKNormalsImageBaker(VKMaterialImageBaker):
     
-    def __init__(self, props):
-        super().__init__(props.bake_normals, props.normals_texture_size, "normals", 'NORMAL', set(), False, True)
+    def __init__(self, enabled, image_size):
+        super().__init__(enabled, image_size, "normals", 'NORMAL', set(), False, True)
         
 # Baker subclass for emission maps
 class VKEmissionImageBaker(VKMaterialImageBaker):
     
-    def __init__(self, props):
-        super().__init__(props.bake_emission, props.emission_texture_size, "emission", 'EMIT', set(), False, True)
+    def __init__(self, enabled, image_size):
+        super().__init__(enabled, image_size, "emission", 'EMIT', set(), False, True)
         
 # Baker subclass for metallic + roughness maps
 class VKMetallicRoughnessImageBaker(VKMaterialImageBaker):
     
-    def __init__(self, props):
-        super().__init__(props.bake_metallic_roughness, props.metallic_roughness_texture_size, "metallic_roughness", 'DIFFUSE', {'COLOR', 'DIFFUSE'}, False, True)
+    def __init__(self, enabled, image_size):
+        super().__init__(enabled, image_size, "metallic_roughness", 'DIFFUSE', {'COLOR', 'DIFFUSE'}, False, True)
     
     # In order to bake a combined metallic + roughness image in the format expected by GLTF 2.0,
     # we need to modify the shader to put out metallic in the blue channel and roughness in the green
     # We use the diffuse color output for this, but we could just as well use the emission output or whatever
     def prepare_node_tree(self, node_tree):
         # Search the material for BSDF nodes
-        bsdf_nodes = filter(lambda node: "Bsdf" in node.bl_idname, node_tree.nodes)
-        for bsdf_node in bsdf_nodes:
+        for bsdf_node in get_bsdf_nodes(self.bsdf_node_cache, node_tree):
             # Most BSDFs have roughness, and I think only Pricipled has metallic, but handle them both
             # as if they may or may not be present
             # If not, just let the unconnected socket default to 0
-            metallic_input = bsdf_node.inputs.get('Metallic', None)
-            roughness_input = bsdf_node.inputs.get('Roughness', None)
+            metallic_input = get_bsdf_input(self.bsdf_input_cache, bsdf_node, 'Metallic')
+            roughness_input = get_bsdf_input(self.bsdf_input_cache, bsdf_node, 'Roughness')
             
             # Try to get the color input (or output? lol)
             # Assuming mostly we're using Principled BSDF, it's called 'Base Color'
             # For basically every other BSDF, it's just 'Color'
             # If there happens to be a strange one that doesn't define either, skip it
-            color_input = bsdf_node.inputs.get('Base Color', None)
+            color_input = get_bsdf_input(self.bsdf_input_cache, bsdf_node, 'Base Color')
             if not color_input:
-                color_input = bsdf_node.inputs.get('Color', None)
+                color_input = get_bsdf_input(self.bsdf_input_cache, bsdf_node, 'Color')
             if not color_input:
                 continue
             
@@ -295,14 +344,54 @@ class VKMetallicRoughnessImageBaker(VKMaterialImageBaker):
                 else:
                     combine_roughness_input.default_value = roughness_input.default_value
             
-            # Unlink and store the color input
+            # Link the combined node to the color input, replacing and storing any existing link
             if color_input.is_linked:
-                self.remove_link(node_tree, color_input.links[0])
-            
-            # Link the combined node to the color input
-            self.add_link(node_tree, combine_node.outputs[0], color_input)
+                self.replace_link(node_tree, color_input.links[0], combine_node.outputs[0])
+            else:
+                self.add_link(node_tree, combine_node.outputs[0], color_input)
         
 
+# Functions linking the image texture node of each bake type to the Principled BSDF of a material created from the bake
+
+def link_diffuse_image(nodes, links, image_node, bsdf_node):
+    links.new(image_node.outputs[0], bsdf_node.inputs['Base Color'])
+    
+def link_normals_image(nodes, links, image_node, bsdf_node):
+    normal_map_node = nodes.new('ShaderNodeNormalMap')
+    links.new(image_node.outputs[0], normal_map_node.inputs['Color'])
+    links.new(normal_map_node.outputs['Normal'], bsdf_node.inputs['Normal'])
+    
+def link_emission_image(nodes, links, image_node, bsdf_node):
+    links.new(image_node.outputs[0], bsdf_node.inputs['Emission'])
+    
+def link_metallic_roughness_image(nodes, links, image_node, bsdf_node):
+    separate_rgb_node = nodes.new('ShaderNodeSeparateRGB')
+    links.new(image_node.outputs[0], separate_rgb_node.inputs['Image'])
+    links.new(separate_rgb_node.outputs['B'], bsdf_node.inputs['Metallic'])
+    links.new(separate_rgb_node.outputs['G'], bsdf_node.inputs['Roughness'])
+
+BAKE_IMAGE_LINKERS = {
+    'diffuse': link_diffuse_image,
+    'normals': link_normals_image,
+    'emission': link_emission_image,
+    'metallic_roughness': link_metallic_roughness_image}
+
+# Create a material using the baked images
+# images is a dictionary where keys are the bake type strings and values are the images baked to
+def create_bake_material(name, images):
+    bake_material = bpy.data.materials.new(name)
+    bake_material.use_nodes = True
+    nodes = bake_material.node_tree.nodes
+    links = bake_material.node_tree.links
+    bsdf_node = nodes['Principled BSDF']
+    
+    for type, image in images.items():
+        image_node = nodes.new('ShaderNodeTexImage')
+        image_node.image = image
+        BAKE_IMAGE_LINKERS[type](nodes, links, image_node, bsdf_node)
+    
+    return bake_material
+
 # Material baking operator
 class VKMB_OP_bake_material(bpy.types.Operator):
     bl_idname = "object.vk_bake_material"
@@ -320,19 +409,25 @@ class VKMB_OP_bake_material(bpy.types.Operator):
         # To avoid this, make sure no two selected objects share materials. If they do, select them separately
         
         props = context.scene.VKMaterialBakeProps
+        # Read the selection once, it's used for the whole bake and shouldn't follow any changes made during it
+        selected_objects = tuple(context.selected_objects)
         
         # Add Image Texture nodes to each material per object, which will reference the bake targets
+        # The keys of added_nodes double as the unique node trees to prepare, since objects often share materials
         added_nodes = {}
         object_image_texture_nodes = {}
         object_images = {}
-        for object in context.selected_objects:
+        for object in selected_objects:
+            # Objects without materials have nowhere to put a bake target, so they're left out of the bake
+            if not object.material_slots:
+                continue
             image_texture_nodes = object_image_texture_nodes[object] = []
             object_images[object] = {}
             for slot in object.material_slots:
                 tree = slot.material.node_tree
                 node = tree.nodes.new("ShaderNodeTexImage")
                 tree.nodes.active = node
-                added_nodes[tree] = [node]
+                added_nodes.setdefault(tree, []).append(node)
                 image_texture_nodes.append(node)
             
         # Setup state and store old
@@ -341,10 +436,22 @@ class VKMB_OP_bake_material(bpy.types.Operator):
         context.scene.render.engine = 'CYCLES'
         context.scene.cycles.samples = 1  # We aren't baking lighting, so more than 1 sample is not necessary
         
+        # Deselect objects left out of the bake, so the bakes only process objects with bake targets
+        skipped_objects = [object for object in selected_objects if object not in object_image_texture_nodes]
+        for object in skipped_objects:
+            object.select_set(False)
+        
         # Execute image bakes
-        bakers = [VKDiffuseImageBaker(props), VKNormalsImageBaker(props), VKEmissionImageBaker(props), VKMetallicRoughnessImageBaker(props)]
+        bakers = [
+            VKDiffuseImageBaker(props.bake_diffuse, props.diffuse_texture_size),
+            VKNormalsImageBaker(props.bake_normals, props.normals_texture_size),
+            VKEmissionImageBaker(props.bake_emission, props.emission_texture_size),
+            VKMetallicRoughnessImageBaker(props.bake_metallic_roughness, props.metallic_roughness_texture_size)]
+        node_trees = list(added_nodes.keys())
+        (bsdf_node_cache, bsdf_input_cache) = ({}, {})
         for baker in bakers:
-            ret = baker.execute(context, object_image_texture_nodes, object_images)
+            ret = baker.execute(context, node_trees, bsdf_node_cache, bsdf_input_cache,
+                object_image_texture_nodes, object_images)
             if ret:
                 self.report(*ret)
         
@@ -352,42 +459,13 @@ class VKMB_OP_bake_material(bpy.types.Operator):
         if props.create_material:
             self.report({'INFO'}, "Creating material(s) from bakes")
             for object, images in object_images.items():
-                bake_material = bpy.data.materials.new(object.name + "_bake")
-                bake_material.use_nodes = True
-                bsdf_node = bake_material.node_tree.nodes['Principled BSDF']
-                
-                image_nodes = {}
-                for type, image in images.items():
-                    image_node = bake_material.node_tree.nodes.new('ShaderNodeTexImage')
-                    image_node.image = image
-                    image_nodes[type] = image_node
-                
-                diffuse_image_node = image_nodes.get('diffuse', None)
-                normals_image_node = image_nodes.get('normals', None)
-                emission_image_node = image_nodes.get('emission', None)
-                metallic_roughness_image_node = image_nodes.get('metallic_roughness', None)
-                
-                if diffuse_image_node:
-                    bake_material.node_tree.links.new(diffuse_image_node.outputs[0], bsdf_node.inputs['Base Color'])
-                    
-                if normals_image_node:
-                    normal_map_node = bake_material.node_tree.nodes.new('ShaderNodeNormalMap')
-                    bake_material.node_tree.links.new(normals_image_node.outputs[0], normal_map_node.inputs['Color'])
-                    bake_material.node_tree.links.new(normal_map_node.outputs['Normal'], bsdf_node.inputs['Normal'])
-                    
-                if emission_image_node:
-                    bake_material.node_tree.links.new(emission_image_node.outputs[0], bsdf_node.inputs['Emission'])
-                    
-                if metallic_roughness_image_node:
-                    separate_rgb_node = bake_material.node_tree.nodes.new('ShaderNodeSeparateRGB')
-                    bake_material.node_tree.links.new(metallic_roughness_image_node.outputs[0], separate_rgb_node.inputs['Image'])
-                    bake_material.node_tree.links.new(separate_rgb_node.outputs['B'], bsdf_node.inputs['Metallic'])
-                    bake_material.node_tree.links.new(separate_rgb_node.outputs['G'], bsdf_node.inputs['Roughness'])
-                    
+                create_bake_material(object.name + "_bake", images)
         
         # Put the scene back
         context.scene.cycles.samples = old_samples
         context.scene.render.engine = old_engine
+        for object in skipped_objects:
+            object.select_set(True)
         
         # Cleanup by removing the added nodes from each of the object's materials    
         for tree, nodes in added_nodes.items():
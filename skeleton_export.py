@@ -1,21 +1,36 @@
 import bpy
 import struct
 from bpy_extras.io_utils import ExportHelper
-from mathutils import Vector
 
-def c_str(s):
-    return struct.pack("<" + str(len(s) + 1) + "s", s.encode("utf-8"))
+# file header: magic and bone count
+HEADER_STRUCT = struct.Struct("<8sB")
+# per bone: position, rotation and parent index
+BONE_STRUCT = struct.Struct("<3f4fb")
 
 def export_skeleton(armature, filename):
+    bones = armature.data.bones
+    # parent indices are written as signed bytes, make sure they fit before packing anything
+    if len(bones) > 128:
+        raise ValueError("Armature has %d bones, only 128 bones can be exported" % len(bones))
+    bone_inds = {bone.name: i for (i, bone) in enumerate(bones)}
+    
+    # pack the whole file into one buffer so it's written all at once
+    data = bytearray(HEADER_STRUCT.size + len(bones) * BONE_STRUCT.size)
+    HEADER_STRUCT.pack_into(data, 0, "skelfile".encode("utf-8"), len(bones))
+    for (i, bone) in enumerate(bones):
+        # fetch each property once, they all go through blender's RNA
+        parent = bone.parent
+        (x, y, z) = bone.head
+        if parent:
+            # the head is relative to the parent's tail, which lies along the parent's y axis
+            y += parent.length
+        rotation = bone.matrix.to_quaternion()
+        BONE_STRUCT.pack_into(data, HEADER_STRUCT.size + i * BONE_STRUCT.size,
+            -x, z, y, -rotation.x, rotation.z, rotation.y, rotation.w,
+            bone_inds[parent.name] if parent else -1)
+    
     with open(filename, "wb") as f:
-        f.write(struct.pack("<8sB", "skelfile".encode("utf-8"), len(armature.data.bones)))
-        
-        for bone in armature.data.bones:
-            position = Vector((0, bone.parent.length, 0)) + bone.head if bone.parent else bone.head
-            f.write(struct.pack("<3f", -position.x, position.z, position.y))
-            rotation = bone.matrix.to_quaternion()
-            f.write(struct.pack("<4f", -rotation.x, rotation.z, rotation.y, rotation.w))
-            f.write(struct.pack("<b", next((i for i in range(len(armature.data.bones)) if armature.data.bones[i] == bone.parent), -1)))
+        f.write(data)
     
     return {'FINISHED'}
 
@@ -43,7 +58,11 @@ class CustomSkeletonExport(bpy.types.Operator, ExportHelper):
     def execute(self, context):
         armature = (context.active_object if type(context.active_object.data) == bpy.types.Armature else
             context.active_object.find_armature())
-        return export_skeleton(armature, self.filepath)
+        try:
+            return export_skeleton(armature, self.filepath)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
 
 def register():
     bpy.utils.register_class(CustomSkeletonExport)